@@ -5,11 +5,11 @@ from pathlib import Path
 import time
 import difflib
 import html
-import groq
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
+import hashlib
+import json
+import threading
+import tempfile
+import uuid
 
 # Import our custom modules
 from code_analyzer import analyze_cpp_code, generate_diff
@@ -23,61 +23,24 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Custom CSS for better styling
-st.markdown("""
-<style>
-    .main {
-        background-color: #1E1E1E;
-        color: #FFFFFF;
-    }
-    .stTextInput, .stTextArea {
-        background-color: #2D2D2D;
-        color: #FFFFFF;
-    }
-    .code-container {
-        background-color: #2D2D2D;
-        border-radius: 5px;
-        padding: 10px;
-        font-family: 'Courier New', monospace;
-    }
-    .explanation-container {
-        background-color: #3D3D3D;
-        border-radius: 5px;
-        padding: 10px;
-        margin-top: 10px;
-    }
-    .stButton button {
-        background-color: #4CAF50;
-        color: white;
-    }
-    .diff-add {
-        background-color: rgba(0, 255, 0, 0.2);
-    }
-    .diff-remove {
-        background-color: rgba(255, 0, 0, 0.2);
-    }
-    .highlight-change {
-        background-color: rgba(255, 255, 0, 0.2);
-        padding: 2px;
-        border-radius: 3px;
-    }
-    .tabs-container {
-        margin-top: 20px;
-    }
-    .integration-success {
-        background-color: #4CAF50;
-        color: white;
-        padding: 10px;
-        border-radius: 5px;
-        margin-top: 10px;
-        animation: fadeIn 1s;
-    }
-    @keyframes fadeIn {
-        from { opacity: 0; }
-        to { opacity: 1; }
-    }
-</style>
-""", unsafe_allow_html=True)
+# Load environment variables from .env file once per process
+@st.cache_resource(show_spinner=False)
+def _env_loaded():
+    """Load the .env file, deferring the dotenv import until it is needed"""
+    from dotenv import load_dotenv
+    load_dotenv()
+    return True
+
+_env_loaded()
+
+# Custom CSS for better styling, read from disk once per process. It is still emitted
+# on every run: Streamlit drops elements that a rerun does not draw again.
+@st.cache_data
+def load_css():
+    """Load the app stylesheet wrapped in a style tag"""
+    return f"<style>\n{Path('style.css').read_text()}</style>"
+
+st.markdown(load_css(), unsafe_allow_html=True)
 
 # Title and description
 st.title("C++ Code Iterator for Game Developers")
@@ -102,6 +65,100 @@ if 'integrated' not in st.session_state:
     st.session_state.integrated = False
 if 'integration_history' not in st.session_state:
     st.session_state.integration_history = []
+if 'archived_history' not in st.session_state:
+    st.session_state.archived_history = []
+if 'integration_count' not in st.session_state:
+    st.session_state.integration_count = 0
+
+# Only the most recent integrations are kept in memory; older ones are spilled to a
+# per-session file on disk, which is itself capped
+HISTORY_LIMIT = 20
+HISTORY_ARCHIVE_LIMIT = 100
+HISTORY_DIR = Path.home() / ".cache" / "cpp_iter"
+HISTORY_MAX_AGE = 7 * 24 * 60 * 60
+
+# Writes to history files are serialized across all sessions in the process
+@st.cache_resource(show_spinner=False)
+def history_lock():
+    """Return the process-wide lock guarding history files"""
+    return threading.Lock()
+
+# Function to remove history files left behind by old sessions
+def prune_history_files():
+    """Delete history files that have not been written to for HISTORY_MAX_AGE seconds"""
+    cutoff = time.time() - HISTORY_MAX_AGE
+    with history_lock():
+        for path in HISTORY_DIR.glob("history*.jsonl"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                pass
+
+# Each session spills to its own file, so offsets can never point at another user's records
+if 'history_session_id' not in st.session_state:
+    st.session_state.history_session_id = uuid.uuid4().hex
+    prune_history_files()
+
+def history_file(session_id):
+    """Return the path of the history file for a session"""
+    return HISTORY_DIR / f"history-{session_id}.jsonl"
+
+# Function to spill history entries to disk
+def archive_history_entries(session_id, archived, entries):
+    """Append entries to the session's history file and return the updated archive metadata"""
+    path = history_file(session_id)
+    with history_lock():
+        HISTORY_DIR.mkdir(parents=True, exist_ok=True)
+        
+        # Past the archive cap, rewrite the file with only the newest records
+        overflow = len(archived) + len(entries) - HISTORY_ARCHIVE_LIMIT
+        if overflow <= 0:
+            archived = list(archived)
+            with path.open("a", encoding="utf-8") as f:
+                _write_history_records(f, session_id, entries, archived)
+            return archived
+        
+        kept = [_read_history_record(path, meta["offset"]) for meta in archived[overflow:]]
+        entries = [record for record in kept if record is not None] + entries[max(0, overflow - len(archived)):]
+        archived = []
+        
+        # Written to a temporary file and swapped in, so a failed rewrite leaves the old
+        # file and the offsets that point into it intact
+        fd, tmp_name = tempfile.mkstemp(dir=HISTORY_DIR, prefix=".history-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                _write_history_records(f, session_id, entries, archived)
+            os.replace(tmp_name, path)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+    return archived
+
+def _write_history_records(f, session_id, entries, archived):
+    """Write entries as JSON lines, appending their (number, timestamp, offset) metadata to archived"""
+    for entry in entries:
+        record = dict(entry, session=session_id)
+        archived.append({"number": entry["number"], "timestamp": entry["timestamp"], "offset": f.tell()})
+        f.write(json.dumps(record) + "\n")
+
+def _read_history_record(path, offset):
+    """Read the record at a byte offset of a history file, or None if it is unreadable"""
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+    except (OSError, ValueError):
+        return None
+
+# Function to lazily read back a single archived entry
+def load_archived_entry(session_id, number, offset):
+    """Read the session's history entry at the given offset, or None if it is missing or not the expected one"""
+    with history_lock():
+        record = _read_history_record(history_file(session_id), offset)
+    if record is None or record.get("session") != session_id or record.get("number") != number:
+        return None
+    return record
 
 # Function to integrate the improved code
 def integrate_code():
@@ -109,44 +166,131 @@ def integrate_code():
     if st.session_state.improved_code:
         # Add to integration history with timestamp
         timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-        st.session_state.integration_history.append({
+        st.session_state.integration_count += 1
+        history = st.session_state.integration_history
+        history.append({
+            "number": st.session_state.integration_count,
             "timestamp": timestamp,
             "original": st.session_state.original_code,
             "improved": st.session_state.improved_code,
             "explanation": st.session_state.explanation
         })
         
+        # Spill the oldest entries to disk once the in-memory cap is exceeded
+        if len(history) > HISTORY_LIMIT:
+            overflow = history[:-HISTORY_LIMIT]
+            try:
+                st.session_state.archived_history = archive_history_entries(
+                    st.session_state.history_session_id, st.session_state.archived_history, overflow
+                )
+            except OSError as e:
+                # Integration must still succeed; the oldest versions are dropped instead
+                st.toast(f"Could not save older history versions to disk: {e}", icon="⚠️")
+            history[:] = history[-HISTORY_LIMIT:]
+        
         # Update the original code with the improved version
         st.session_state.original_code = st.session_state.improved_code
         st.session_state.integrated = True
 
+# Function to restore a previous version from the history
+def restore_version(code):
+    """Make a previous version the original code and clear the current results"""
+    st.session_state.original_code = code
+    st.session_state.improved_code = ""
+    st.session_state.explanation = ""
+    st.session_state.diff_html = ""
+    st.session_state.integrated = False
+
+# Functions to toggle whether a history entry's code is shown
+def open_history_entry(open_key):
+    """Show the code of a history entry on the next run"""
+    st.session_state[open_key] = True
+
+def close_history_entry(open_key):
+    """Hide the code of a history entry so it is no longer rendered"""
+    st.session_state[open_key] = False
+
+# Function to render one integration history entry in the sidebar
+def show_history_entry(number, label, get_code):
+    """Render a history expander whose code is only fetched and highlighted on request"""
+    open_key = f"open_history_{number}"
+    with st.expander(f"Integration #{number}: {label}", expanded=st.session_state.get(open_key, False)):
+        if not st.session_state.get(open_key):
+            st.button("Show code", key=f"show_history_{number}",
+                      on_click=open_history_entry, args=(open_key,))
+        else:
+            # Hiding stops the code from being fetched and highlighted on every rerun
+            st.button("Hide code", key=f"hide_history_{number}",
+                      on_click=close_history_entry, args=(open_key,))
+            code = get_code()
+            if code is None:
+                st.warning("This archived version is no longer available.")
+                return
+            st.code(code, language="cpp")
+            # The callback updates the code text area's state before any rerun; the
+            # full-app rerun then redraws it, which a fragment rerun alone would not
+            if st.button("Restore this version", key=f"restore_{number}",
+                         on_click=restore_version, args=(code,)):
+                st.rerun()
+
 # Function to display diff with highlighted changes
 def display_diff():
     """Display the diff between original and improved code"""
     if st.session_state.diff_html:
-        # Clean up the diff HTML for display
-        cleaned_diff = st.session_state.diff_html.replace(
-            '<table class="diff"', 
-            '<table class="diff" style="width:100%; font-family:monospace; border-collapse:collapse;"'
-        )
-        
         # Create a custom component to properly render the HTML
         components.html(
-            cleaned_diff,
+            st.session_state.diff_html,
             height=600,
             scrolling=True
         )
     else:
         st.info("No differences to display.")
 
-# Sidebar with example code and history
-with st.sidebar:
-    st.header("Example Code")
-    example_files = {
+# Example files never change while the app runs, so read them once per process
+@st.cache_data
+def load_examples():
+    """Load the bundled example C++ snippets keyed by display name"""
+    return {
         "None": "",
         "Game Physics System": Path("examples/entity_component.cpp").read_text(),
         "Entity Component System": Path("examples/game_physics.cpp").read_text()
     }
+
+# Sidebar integration history. Showing an entry's code only reruns this fragment;
+# restoring a version still reruns the whole app to update the code text area.
+@st.fragment
+def integration_history_panel():
+    """Render the integration history with lazily loaded entries"""
+    st.header("Integration History")
+    history = st.session_state.integration_history
+    archived = st.session_state.archived_history
+    if history or archived:
+        st.markdown("""
+        <div style="background-color: #f0f8ff; padding: 10px; border-radius: 5px; margin-bottom: 10px;">
+            <p>📝 <strong>Previous versions of your code are saved here.</strong> Click to expand and view.</p>
+        </div>
+        """, unsafe_allow_html=True)
+        
+        # Expanders start collapsed with only a button inside; the code block is built
+        # once the user asks for it, so closed entries cost nothing to render
+        for entry in reversed(history):
+            show_history_entry(entry['number'], entry['timestamp'], lambda entry=entry: entry['improved'])
+        
+        # Archived entries only keep their timestamp in memory; the code is read on demand
+        session_id = st.session_state.history_session_id
+        for meta in reversed(archived):
+            show_history_entry(
+                meta['number'],
+                f"{meta['timestamp']} (archived)",
+                lambda meta=meta: (load_archived_entry(session_id, meta['number'], meta['offset']) or {}).get('improved')
+            )
+    else:
+        st.info("No integration history yet. When you click 'Integrate Code', versions will be saved here.")
+
+# Sidebar with example code and history
+with st.sidebar:
+    st.header("Example Code")
+    example_files = load_examples()
     
     selected_example = st.selectbox("Select an example:", list(example_files.keys()))
     
@@ -159,26 +303,7 @@ with st.sidebar:
             st.session_state.integrated = False
     
     # Integration history
-    st.header("Integration History")
-    if st.session_state.integration_history:
-        st.markdown("""
-        <div style="background-color: #f0f8ff; padding: 10px; border-radius: 5px; margin-bottom: 10px;">
-            <p>📝 <strong>Previous versions of your code are saved here.</strong> Click to expand and view.</p>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        for i, entry in enumerate(reversed(st.session_state.integration_history)):
-            with st.expander(f"Integration #{len(st.session_state.integration_history) - i}: {entry['timestamp']}"):
-                st.code(entry['improved'], language="cpp")
-                if st.button(f"Restore this version", key=f"restore_{i}"):
-                    st.session_state.original_code = entry['improved']
-                    st.session_state.improved_code = ""
-                    st.session_state.explanation = ""
-                    st.session_state.diff_html = ""
-                    st.session_state.integrated = False
-                    st.rerun()
-    else:
-        st.info("No integration history yet. When you click 'Integrate Code', versions will be saved here.")
+    integration_history_panel()
 
 # Main content area with two columns
 col1, col2 = st.columns(2)
@@ -186,15 +311,8 @@ col1, col2 = st.columns(2)
 # Left column for original code input
 with col1:
     st.header("Original Code")
-    original_code = st.text_area("Paste your C++ code here:", value=st.session_state.original_code, height=400, key="original_code_input")
-    
-    # Update session state when input changes
-    if original_code != st.session_state.original_code:
-        st.session_state.original_code = original_code
-        st.session_state.improved_code = ""
-        st.session_state.explanation = ""
-        st.session_state.diff_html = ""
-        st.session_state.integrated = False
+    # Bound directly to session state; edits no longer clear the previous results
+    st.text_area("Paste your C++ code here:", height=400, key="original_code")
     
     prompt = st.text_area("What would you like to improve?", 
                          placeholder="E.g., 'Optimize for performance', 'Improve memory management', 'Fix potential bugs', 'Apply modern C++ practices'",
@@ -202,20 +320,30 @@ with col1:
     
     if st.button("Generate Improvements", type="primary"):
         if st.session_state.original_code and prompt:
-            with st.spinner("Analyzing code and generating improvements..."):
-                # First perform local analysis
-                analysis_results = analyze_cpp_code(st.session_state.original_code)
-                st.session_state.analysis_results = analysis_results
+            with st.status("Analyzing code...", expanded=True) as status:
+                # First perform local analysis, reusing the last result if the code is unchanged
+                code_hash = hashlib.sha1(st.session_state.original_code.encode()).digest()
+                if st.session_state.get('analysis_hash') == code_hash:
+                    analysis_results = st.session_state.analysis_results
+                else:
+                    analysis_results = analyze_cpp_code(st.session_state.original_code)
+                    st.session_state.analysis_results = analysis_results
+                    st.session_state.analysis_hash = code_hash
                 
                 # Then generate suggestions using both local analysis and OpenAI
+                # Show the response as it streams in; replaced by the tabs on rerun
+                status.update(label="Generating improvements...")
+                stream_placeholder = st.empty()
                 improved_code, explanation, diff_html = generate_code_suggestions(
-                    st.session_state.original_code, prompt
+                    st.session_state.original_code, prompt, analysis_results,
+                    placeholder=stream_placeholder
                 )
                 
                 st.session_state.improved_code = improved_code
                 st.session_state.explanation = explanation
                 st.session_state.diff_html = diff_html
                 st.session_state.integrated = False
+                status.update(label="Improvements generated", state="complete")
                 
                 # Force a rerun to update the UI
                 st.rerun()
@@ -235,9 +363,8 @@ with col2:
             st.code(st.session_state.improved_code, language="cpp")
             st.markdown('</div>', unsafe_allow_html=True)
             
-            if st.button("Integrate Code", type="primary"):
-                integrate_code()
-                st.rerun()
+            # Runs as a callback, before the code text area is drawn on the next run
+            st.button("Integrate Code", type="primary", on_click=integrate_code)
         
         with diff_tab:
             st.markdown('<div class="diff-container">', unsafe_allow_html=True)
@@ -1,12 +1,32 @@
 import re
 import difflib
+import html
+
+# Styling for the diff HTML; it is rendered in its own iframe, so the app's CSS does not apply
+DIFF_STYLE = """<style>
+    .diff { font-family: monospace; font-size: 13px; margin: 0; white-space: pre; }
+    .diff-add { background-color: rgba(0, 255, 0, 0.2); }
+    .diff-remove { background-color: rgba(255, 0, 0, 0.2); }
+    .diff-hunk { color: #888888; }
+</style>"""
+
+# Precompiled patterns used by analyze_cpp_code
+RAW_POINTER_RE = re.compile(r'\b(\w+)\s*\*\s*(\w+)\s*=')
+C_ARRAY_RE = re.compile(r'\b(\w+)\s+(\w+)\[(\d+)\]')
+FLOAT_CMP_RE = re.compile(r'(==|!=)\s*\d*\.\d+f?')
+MAGIC_NUM_RE = re.compile(r'[^\.]\d+\.\d+f?')
+CONST_FLOAT_RE = re.compile(r'const\s+float')
+UNINIT_RE = re.compile(r'(\w+)\s+(\w+);')
+TYPE_DECL_RE = re.compile(r'class|struct|enum')
+# Whole type names only, so 'Point x;' or 'uint x;' are not mistaken for 'int x;'
+PRIMITIVE_DECL_RE = re.compile(r'\b(?:int|float|double|bool|char)\s+\w+;')
 
 def analyze_cpp_code(code):
     """
     Analyze C++ code for common issues and improvement opportunities.
     
     Args:
-        code (str): The C++ code to analyze
+        code (str or list): The C++ code to analyze, or its already-split lines
         
     Returns:
         dict: Analysis results with categories of issues and suggestions
@@ -20,104 +40,128 @@ def analyze_cpp_code(code):
         "potential_bugs": []
     }
     
-    # Split code into lines for analysis
-    lines = code.split('\n')
+    # Split code into lines for analysis, unless the caller already did
+    lines = code if isinstance(code, list) else code.splitlines()
+    
+    memory_management = analysis["memory_management"]
+    modern_cpp = analysis["modern_cpp"]
+    performance_issues = analysis["performance_issues"]
+    game_specific = analysis["game_specific"]
+    code_style = analysis["code_style"]
+    potential_bugs = analysis["potential_bugs"]
+    
+    # Context windows (in lines) for the checks that look at preceding code
+    loop_window = 5
+    hot_path_window = 10
+    null_check_window = 3
     
-    # Check for raw pointers (could be replaced with smart pointers)
-    raw_pointer_pattern = r'\b(\w+)\s*\*\s*(\w+)\s*='
+    # Remaining lifetime, in lines, of the most recent keyword sighting
+    for_recent = 0
+    while_recent = 0
+    update_recent = 0
+    render_recent = 0
+    null_check_recent = 0
+    
+    # Single pass: every check is applied to each line in turn
     for i, line in enumerate(lines):
-        if re.search(raw_pointer_pattern, line) and 'std::' not in line and 'shared_ptr' not in line and 'unique_ptr' not in line:
-            analysis["memory_management"].append({
-                "line": i + 1,
-                "code": line.strip(),
+        stripped = line.strip()
+        line_num = i + 1
+        
+        # Cheap substring gates: each regex below can only match if its literal is present
+        has_pointer_assign = '*' in line and '=' in line
+        has_decimal = '.' in line
+        
+        # Check for raw pointers (could be replaced with smart pointers)
+        if has_pointer_assign and RAW_POINTER_RE.search(line) and 'std::' not in line and 'shared_ptr' not in line and 'unique_ptr' not in line:
+            memory_management.append({
+                "line": line_num,
+                "code": stripped,
                 "issue": "Raw pointer usage",
                 "suggestion": "Consider using smart pointers (std::unique_ptr or std::shared_ptr) for automatic memory management"
             })
-    
-    # Check for C-style arrays (could use std::array or std::vector)
-    c_array_pattern = r'\b(\w+)\s+(\w+)\[(\d+)\]'
-    for i, line in enumerate(lines):
-        if re.search(c_array_pattern, line) and 'char' not in line:  # Exclude char arrays which might be for C strings
-            analysis["modern_cpp"].append({
-                "line": i + 1,
-                "code": line.strip(),
+        
+        # Check for C-style arrays (could use std::array or std::vector)
+        if '[' in line and C_ARRAY_RE.search(line) and 'char' not in line:  # Exclude char arrays which might be for C strings
+            modern_cpp.append({
+                "line": line_num,
+                "code": stripped,
                 "issue": "C-style array usage",
                 "suggestion": "Consider using std::array for fixed-size arrays or std::vector for dynamic arrays"
             })
-    
-    # Check for manual loop iterations over containers (could use range-based for loops)
-    for i, line in enumerate(lines):
-        if 'for' in line and '; i < ' in line and '.size()' in line:
-            analysis["modern_cpp"].append({
-                "line": i + 1,
-                "code": line.strip(),
+        
+        has_for = 'for' in line
+        
+        # Check for manual loop iterations over containers (could use range-based for loops)
+        if has_for and '; i < ' in line and '.size()' in line:
+            modern_cpp.append({
+                "line": line_num,
+                "code": stripped,
                 "issue": "Index-based loop over container",
                 "suggestion": "Consider using range-based for loop: for (auto& element : container)"
             })
-    
-    # Check for potential performance issues in game code
-    for i, line in enumerate(lines):
-        # Check for sqrt in tight loops (expensive operation)
-        if 'sqrt' in line and ('for' in lines[max(0, i-5):i] or 'while' in lines[max(0, i-5):i]):
-            analysis["performance_issues"].append({
-                "line": i + 1,
-                "code": line.strip(),
+        
+        # Check for sqrt in tight loops (expensive operation); the substring test comes first
+        if 'sqrt' in line and (for_recent or while_recent):
+            performance_issues.append({
+                "line": line_num,
+                "code": stripped,
                 "issue": "Expensive sqrt operation in loop",
                 "suggestion": "For magnitude comparisons, consider using squared magnitude (x*x + y*y) instead of sqrt(x*x + y*y)"
             })
         
         # Check for string operations in performance-critical sections
-        if ('std::string' in line or '+=' in line and '"' in line) and ('update' in lines[max(0, i-10):i] or 'render' in lines[max(0, i-10):i]):
-            analysis["performance_issues"].append({
-                "line": i + 1,
-                "code": line.strip(),
+        if (update_recent or render_recent) and ('std::string' in line or '+=' in line and '"' in line):
+            performance_issues.append({
+                "line": line_num,
+                "code": stripped,
                 "issue": "String operations in performance-critical code",
                 "suggestion": "String operations can be expensive. Consider moving string manipulations outside of update/render loops"
             })
-    
-    # Check for game-specific patterns
-    for i, line in enumerate(lines):
+        
         # Check for direct floating-point comparisons (problematic in games)
-        if re.search(r'(==|!=)\s*\d*\.\d+f?', line):
-            analysis["game_specific"].append({
-                "line": i + 1,
-                "code": line.strip(),
+        if has_decimal and FLOAT_CMP_RE.search(line):
+            game_specific.append({
+                "line": line_num,
+                "code": stripped,
                 "issue": "Direct floating-point comparison",
                 "suggestion": "Use epsilon-based comparison for floating-point values to avoid precision issues"
             })
         
         # Check for magic numbers in game code
-        if re.search(r'[^\.]\d+\.\d+f?', line) and not re.search(r'const\s+float', line) and not re.search(r'#define', line):
-            analysis["code_style"].append({
-                "line": i + 1,
-                "code": line.strip(),
+        if has_decimal and MAGIC_NUM_RE.search(line) and not CONST_FLOAT_RE.search(line) and '#define' not in line:
+            code_style.append({
+                "line": line_num,
+                "code": stripped,
                 "issue": "Magic number usage",
                 "suggestion": "Define named constants for magic numbers to improve code readability and maintainability"
             })
-    
-    # Check for potential bugs
-    for i, line in enumerate(lines):
-        # Check for uninitialized variables
-        if re.search(r'(\w+)\s+(\w+);', line) and not re.search(r'=', line) and not re.search(r'class|struct|enum', line):
-            # Check if it's a primitive type
-            primitive_types = ['int', 'float', 'double', 'bool', 'char']
-            for type_name in primitive_types:
-                if re.search(rf'{type_name}\s+\w+;', line):
-                    analysis["potential_bugs"].append({
-                        "line": i + 1,
-                        "code": line.strip(),
-                        "issue": "Uninitialized primitive variable",
-                        "suggestion": "Initialize variables at declaration to avoid undefined behavior"
-                    })
         
-        # Check for potential null pointer dereference
-        if '->' in line and 'if' not in lines[max(0, i-3):i] and 'nullptr' not in lines[max(0, i-3):i] and 'NULL' not in lines[max(0, i-3):i]:
-            analysis["potential_bugs"].append({
-                "line": i + 1,
-                "code": line.strip(),
+        # Check for uninitialized primitive variables
+        if ';' in line and '=' not in line and UNINIT_RE.search(line) and not TYPE_DECL_RE.search(line) and PRIMITIVE_DECL_RE.search(line):
+            potential_bugs.append({
+                "line": line_num,
+                "code": stripped,
+                "issue": "Uninitialized primitive variable",
+                "suggestion": "Initialize variables at declaration to avoid undefined behavior"
+            })
+        
+        # Check for potential null pointer dereference; most lines have no '->' and stop here
+        has_arrow = '->' in line
+        if has_arrow and not null_check_recent:
+            potential_bugs.append({
+                "line": line_num,
+                "code": stripped,
                 "issue": "Potential null pointer dereference",
                 "suggestion": "Add null check before dereferencing pointers"
             })
+        
+        # Age the context windows; a keyword on this line covers the following lines
+        for_recent = loop_window if has_for else max(0, for_recent - 1)
+        while_recent = loop_window if 'while' in line else max(0, while_recent - 1)
+        update_recent = hot_path_window if 'update' in line else max(0, update_recent - 1)
+        render_recent = hot_path_window if 'render' in line else max(0, render_recent - 1)
+        has_null_check = 'if' in line or 'nullptr' in line or 'NULL' in line
+        null_check_recent = null_check_window if has_null_check else max(0, null_check_recent - 1)
     
     return analysis
 
@@ -126,20 +170,42 @@ def generate_diff(original_code, improved_code):
     Generate a diff between original and improved code.
     
     Args:
-        original_code (str): The original code
-        improved_code (str): The improved code
+        original_code (str or list): The original code, or its already-split lines
+        improved_code (str or list): The improved code, or its already-split lines
         
     Returns:
         str: HTML-formatted diff
     """
-    diff = difflib.HtmlDiff().make_file(
-        original_code.splitlines(),
-        improved_code.splitlines(),
+    original_lines = original_code if isinstance(original_code, list) else original_code.splitlines()
+    improved_lines = improved_code if isinstance(improved_code, list) else improved_code.splitlines()
+    
+    diff_lines = difflib.unified_diff(
+        original_lines,
+        improved_lines,
         "Original Code",
         "Improved Code",
-        context=True
+        n=3,
+        lineterm=""
     )
-    return diff
+    
+    rendered = []
+    for index, line in enumerate(diff_lines):
+        escaped = html.escape(line)
+        # The first two lines are the file headers, not removed/added code
+        if index < 2 or line.startswith('@@'):
+            rendered.append(f'<span class="diff-hunk">{escaped}</span>')
+        elif line.startswith('+'):
+            rendered.append(f'<span class="diff-add">{escaped}</span>')
+        elif line.startswith('-'):
+            rendered.append(f'<span class="diff-remove">{escaped}</span>')
+        else:
+            rendered.append(escaped)
+    
+    # No changes: let the caller show its "no differences" message
+    if not rendered:
+        return ""
+    
+    return f'{DIFF_STYLE}<pre class="diff">' + "\n".join(rendered) + '</pre>'
 
 def suggest_improvements(analysis, code):
     """
@@ -1,72 +1,258 @@
-import groq
 import re
 import os
+import time
+import asyncio
+import queue
+import threading
+from collections import OrderedDict
+import streamlit as st
 from code_analyzer import analyze_cpp_code, generate_diff
 
-def generate_code_suggestions(code, prompt):
+GROQ_MODEL = "llama3-70b-8192"
+
+# Upper bound, in seconds, on a single Groq request including the full stream
+GROQ_TIMEOUT = 60
+
+# How often, in seconds, an idle stream refreshes the placeholder. Streamlit only acts
+# on a stop or rerun when the script sends an element, so this bounds how long a
+# stopped run keeps waiting on a silent stream
+STREAM_POLL_INTERVAL = 0.5
+
+# Streamed text is pushed to the placeholder at most every STREAM_UPDATE_INTERVAL seconds
+# or STREAM_UPDATE_CHARS new characters, since each update re-sends the whole buffer
+STREAM_UPDATE_INTERVAL = 0.1
+STREAM_UPDATE_CHARS = 300
+
+# Completed responses keyed on (model, analysis, code, prompt). Streamed calls cannot go
+# through st.cache_data, which would record and replay every placeholder update.
+RESPONSE_CACHE_TTL = 3600
+RESPONSE_CACHE_MAX_ENTRIES = 32
+_response_cache = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+# Kept free of per-request data so providers that cache prompt prefixes can reuse it
+SYSTEM_PROMPT = """You are a C++ expert specializing in game development. 
+Your task is to improve the provided code based on the user's request and the static analysis results.
+Focus on performance, readability, and best practices for game development.
+
+The user's message contains the static analysis of the code, followed by the code and their request.
+
+Provide your response in the following format:
+1. The complete improved code in a ```cpp code block
+2. A detailed explanation of all changes made, organized by category (performance, memory management, etc.)
+3. Highlight the most important improvements first
+
+Make sure your improvements address both the user's specific request and the issues identified in the analysis.
+For game development, prioritize performance optimizations and memory management improvements."""
+
+def generate_code_suggestions(code, prompt, analysis=None, placeholder=None):
     """
     Generate code improvement suggestions using Groq API and local analysis.
     
     Args:
         code (str): The original C++ code
         prompt (str): User's improvement request
+        analysis (dict, optional): Precomputed results of analyze_cpp_code(code);
+            computed here when not provided
+        placeholder (optional): Streamlit placeholder (e.g. st.empty()) that shows
+            the response as it streams in
         
     Returns:
         tuple: (improved_code, explanation, diff)
     """
-    # First perform local analysis to identify issues
-    analysis = analyze_cpp_code(code)
+    # Split once; both the analysis and the diff work on the line list
+    code_lines = code.splitlines()
+    
+    # First perform local analysis to identify issues, unless the caller already did
+    if analysis is None:
+        analysis = analyze_cpp_code(code_lines)
     
     # Prepare a system message with the analysis results
     analysis_text = format_analysis_for_prompt(analysis)
     
-    # Create a prompt for Groq that includes the analysis
     try:
-        api_key = os.environ.get("GROQ_API_KEY")
-        if not api_key:
+        if not os.environ.get("GROQ_API_KEY"):
             raise ValueError("GROQ_API_KEY environment variable is not set")
-            
-        # Initialize Groq client with minimal configuration
-        client = groq.Groq(api_key=api_key)
         
-        # Create the chat completion request
-        response = client.chat.completions.create(
-            model="llama3-70b-8192",
-            messages=[
-                {"role": "system", "content": f"""You are a C++ expert specializing in game development. 
-Your task is to improve the provided code based on the user's request and the static analysis results.
-Focus on performance, readability, and best practices for game development.
-
-Here's the static analysis of the code:
-{analysis_text}
-
-Provide your response in the following format:
-1. The complete improved code in a ```cpp code block
-2. A detailed explanation of all changes made, organized by category (performance, memory management, etc.)
-3. Highlight the most important improvements first
-
-Make sure your improvements address both the user's specific request and the issues identified in the analysis.
-For game development, prioritize performance optimizations and memory management improvements."""},
-                {"role": "user", "content": f"Here is my C++ game development code:\n\n```cpp\n{code}\n```\n\nI want to improve it by: {prompt}"}
-            ],
-            temperature=0.2,
-            max_tokens=4000
-        )
-        
-        # Extract the response content
-        response_text = response.choices[0].message.content
+        # Identical requests are answered from the cache instead of the API
+        cache_key = (GROQ_MODEL, analysis_text, code, prompt)
+        response_text = _get_cached_response(cache_key)
+        if response_text is None:
+            on_chunk = None
+            if placeholder is not None:
+                on_chunk = lambda text: placeholder.code(text, language="cpp")
+            response_text = _groq_complete(code, prompt, GROQ_MODEL, analysis_text, on_chunk)
+            _store_response(cache_key, response_text)
         
         # Split the response into code and explanation
         improved_code, explanation = extract_code_and_explanation(response_text)
         
         # Generate a diff between original and improved code
-        diff = generate_diff(code, improved_code)
+        diff = generate_diff(code_lines, improved_code)
         
         return improved_code, explanation, diff
     
     except Exception as e:
         return code, f"Error generating suggestions: {str(e)}", ""
 
+@st.cache_resource(show_spinner=False)
+def _groq_runtime():
+    """
+    Start a background event loop and create the async Groq client once per process.
+    
+    The client stays bound to this loop, so its HTTP connection pool is reused
+    across requests instead of being rebuilt for a fresh asyncio.run() loop.
+    
+    Returns:
+        tuple: (event loop, groq.AsyncGroq client)
+    """
+    # Imported lazily so app startup does not pay for loading the Groq SDK
+    import groq
+    
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="groq-event-loop", daemon=True).start()
+    
+    # Initialize Groq client with minimal configuration
+    return loop, groq.AsyncGroq(api_key=os.environ["GROQ_API_KEY"])
+
+def _get_cached_response(key):
+    """
+    Look up a completed response, dropping it if it has expired.
+    
+    Args:
+        key (tuple): Cache key built from the request inputs
+        
+    Returns:
+        str: The cached response text, or None on a miss
+    """
+    with _response_cache_lock:
+        entry = _response_cache.get(key)
+        if entry is None:
+            return None
+        stored_at, response_text = entry
+        if time.monotonic() - stored_at > RESPONSE_CACHE_TTL:
+            del _response_cache[key]
+            return None
+        return response_text
+
+def _store_response(key, response_text):
+    """
+    Cache a completed response, evicting the oldest entries beyond the size cap.
+    
+    Args:
+        key (tuple): Cache key built from the request inputs
+        response_text (str): The full response text
+    """
+    with _response_cache_lock:
+        _response_cache[key] = (time.monotonic(), response_text)
+        _response_cache.move_to_end(key)
+        while len(_response_cache) > RESPONSE_CACHE_MAX_ENTRIES:
+            _response_cache.popitem(last=False)
+
+def _groq_complete(code, prompt, model, analysis_text, on_chunk=None):
+    """
+    Request improved code from the Groq API, streaming the response.
+    
+    The call is bounded by GROQ_TIMEOUT. With on_chunk set, a stop or rerun of the
+    Streamlit run is noticed on the next update, which comes at least every
+    STREAM_POLL_INTERVAL seconds, and cancels the request. Without on_chunk, the
+    request runs until it completes or times out.
+    
+    Args:
+        code (str): The original C++ code
+        prompt (str): User's improvement request
+        model (str): Groq model name
+        analysis_text (str): Formatted static analysis results
+        on_chunk (callable, optional): Called with the accumulated text as it streams
+            in (throttled), again every STREAM_POLL_INTERVAL seconds while idle, and
+            once with the full text at the end
+        
+    Returns:
+        str: The full response text
+    """
+    loop, client = _groq_runtime()
+    messages = [
+        # Static instructions first so the prefix is byte-identical across requests
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"Here's the static analysis of the code:\n{analysis_text}\n\nHere is my C++ game development code:\n\n```cpp\n{code}\n```\n\nI want to improve it by: {prompt}"}
+    ]
+    
+    # The request runs on the background loop; chunks come back through a queue so
+    # Streamlit calls stay on the script thread
+    chunks = queue.Queue()
+    future = asyncio.run_coroutine_threadsafe(
+        asyncio.wait_for(_stream_completion(client, model, messages, chunks), timeout=GROQ_TIMEOUT),
+        loop
+    )
+    
+    # Accumulate the streamed content, reporting progress as it arrives
+    parts = []
+    pending_chars = 0
+    last_update = time.monotonic()
+    try:
+        while True:
+            try:
+                delta = chunks.get(timeout=STREAM_POLL_INTERVAL)
+            except queue.Empty:
+                # Re-send the current text so Streamlit can raise a pending stop or rerun
+                if on_chunk is not None:
+                    on_chunk("".join(parts))
+                    pending_chars = 0
+                    last_update = time.monotonic()
+                continue
+            if delta is None:
+                break
+            parts.append(delta)
+            pending_chars += len(delta)
+            if on_chunk is not None and (pending_chars >= STREAM_UPDATE_CHARS
+                                         or time.monotonic() - last_update >= STREAM_UPDATE_INTERVAL):
+                on_chunk("".join(parts))
+                pending_chars = 0
+                last_update = time.monotonic()
+        
+        # Surface API errors and timeouts raised on the loop
+        try:
+            future.result()
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Groq request timed out after {GROQ_TIMEOUT} seconds")
+        
+        response_text = "".join(parts)
+        if on_chunk is not None and pending_chars:
+            on_chunk(response_text)
+    finally:
+        # Stops the request if the script run was interrupted, e.g. by a rerun
+        future.cancel()
+    
+    return response_text
+
+async def _stream_completion(client, model, messages, chunks):
+    """
+    Stream a chat completion, putting each content delta on a queue.
+    
+    Args:
+        client (groq.AsyncGroq): The shared async API client
+        model (str): Groq model name
+        messages (list): Chat messages for the request
+        chunks (queue.Queue): Receives content deltas, then None once the stream ends
+    """
+    try:
+        # Create the chat completion request
+        response = await client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=0.2,
+            max_tokens=4000,
+            stream=True
+        )
+        
+        async for chunk in response:
+            delta = chunk.choices[0].delta.content or ""
+            if delta:
+                chunks.put(delta)
+    finally:
+        # Always signal the end, including on errors, timeouts and cancellation
+        chunks.put(None)
+
 def format_analysis_for_prompt(analysis):
     """
     Format the analysis results for inclusion in the OpenAI prompt.
@@ -78,6 +264,7 @@ def format_analysis_for_prompt(analysis):
         str: Formatted analysis text
     """
     result = []
+    extend = result.extend
     
     for category, issues in analysis.items():
         if issues:
@@ -85,9 +272,12 @@ def format_analysis_for_prompt(analysis):
             result.append(f"## {category_name}")
             
             for issue in issues:
-                result.append(f"- Line {issue['line']}: {issue['issue']}")
-                result.append(f"  Code: {issue['code']}")
-                result.append(f"  Suggestion: {issue['suggestion']}")
+                # One extend per issue instead of three appends
+                extend((
+                    f"- Line {issue['line']}: {issue['issue']}",
+                    f"  Code: {issue['code']}",
+                    f"  Suggestion: {issue['suggestion']}"
+                ))
             
             result.append("")  # Empty line between categories
     
@@ -133,6 +323,6 @@ def highlight_changes(original_code, improved_code):
     improved_lines = improved_code.splitlines()
     
     # Use difflib to find differences
-    diff = generate_diff(original_code, improved_code)
+    diff = generate_diff(original_lines, improved_lines)
     
     return diff